@@ -1,5 +1,7 @@
 import os
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 
 from flask import Flask, render_template, url_for, request, jsonify, flash, redirect
 from flask_marshmallow import Marshmallow
@@ -7,9 +9,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, UserMixin, login_user, current_user, logout_user, login_required
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Table, Column, Integer, String, Float
+from sqlalchemy import Table, Column, Integer, String, Float, select, insert, delete
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from response_cache import init_response_cache, etag_cached
+from rate_limit import init_rate_limiter
 from forms import LoginForm, RegistrationForm, SkillForm, UserSkillForm, ResourceForm, ConnectionRequestForm, ProfileUpdateForm, PostForm, DeletePostForm
 
 
@@ -18,13 +22,37 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here' 
 
 # Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'peer_to_peer.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'peer_to_peer.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection archival: closed (rejected/completed) connections older than
+# CONNECTION_ARCHIVE_AFTER_DAYS are moved out of the hot `connection` table
+# in batches of CONNECTION_ARCHIVE_BATCH_SIZE every CONNECTION_ARCHIVE_INTERVAL seconds
+app.config['CONNECTION_ARCHIVE_AFTER_DAYS'] = 30
+app.config['CONNECTION_ARCHIVE_BATCH_SIZE'] = 500
+app.config['CONNECTION_ARCHIVE_INTERVAL'] = 3600
+
+# Response caching: ETags for read-only pages and compression of HTML bodies
+# of at least COMPRESS_MIN_SIZE bytes (see response_cache.py)
+app.config['RESPONSE_CACHE_ENABLED'] = True
+app.config['COMPRESS_MIN_SIZE'] = 500
+
+# Rate limiting (see rate_limit.py): endpoint -> token bucket limits as
+# (requests, seconds) per client IP and/or per logged-in user.
+# Set RATELIMIT_STORAGE_PATH to a file to share the buckets between workers.
+app.config['RATELIMITS'] = {
+    'login': {'methods': ('POST',), 'ip': (10, 60)},
+    'register': {'methods': ('POST',), 'ip': (5, 600)},
+    'request_connection': {'ip': (60, 3600), 'user': (20, 3600)},
+}
+app.config['RATELIMIT_STORAGE_PATH'] = os.environ.get('RATELIMIT_STORAGE_PATH')
+
 # Initialize database
 db = SQLAlchemy(app)
 ma = Marshmallow(app)
 migrate = Migrate(app, db)
+init_response_cache(app, db)
+init_rate_limiter(app)
 
 # Initialize login manager
 login_manager = LoginManager(app)
@@ -79,14 +107,22 @@ class UserSkill(db.Model):
         role = "Teacher" if self.is_teacher else "Learner"
         return f'<UserSkill {self.user.username} - {self.skill.name} ({role})>'
 
+# Connection lifecycle: live rows stay in the hot table, closed rows are archived
+LIVE_CONNECTION_STATUSES = ('pending', 'pending_learner', 'pending_teacher', 'accepted')
+CLOSED_CONNECTION_STATUSES = ('rejected', 'completed')
+
 # Define Connection model
 class Connection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    learner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    learner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     skill_id = db.Column(db.Integer, db.ForeignKey('skill.id'), nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending_learner, pending_teacher, accepted, rejected, completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)  # Set when the connection is rejected or completed
+    
+    # Lets the archival sweep find old closed rows without scanning live ones
+    __table_args__ = (db.Index('ix_connection_status_closed_at', 'status', 'closed_at'),)
     
     # Define relationships
     teacher = db.relationship('User', foreign_keys=[teacher_id], backref=db.backref('teaching_connections', lazy=True))
@@ -96,6 +132,29 @@ class Connection(db.Model):
     def __repr__(self):
         return f'<Connection {self.teacher.username} teaching {self.learner.username} - {self.skill.name}>'
 
+# Define ConnectionArchive model (cold storage for closed connections)
+class ConnectionArchive(db.Model):
+    __tablename__ = 'connection_archive'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Id the row had in the connection table; SQLite may reuse it for a later connection
+    connection_id = db.Column(db.Integer, nullable=False, index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    learner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    skill_id = db.Column(db.Integer, db.ForeignKey('skill.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # rejected, completed
+    created_at = db.Column(db.DateTime)
+    closed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # No backrefs, so loading a user never pulls in their archived history
+    teacher = db.relationship('User', foreign_keys=[teacher_id])
+    learner = db.relationship('User', foreign_keys=[learner_id])
+    skill = db.relationship('Skill')
+    
+    def __repr__(self):
+        return f'<ConnectionArchive {self.id} ({self.status})>'
+
 # Define Resource model
 class Resource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -131,11 +190,97 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+def archive_closed_connections(older_than=None, batch_size=None):
+    """Move closed connections older than `older_than` into the archive table.
+
+    Rows are copied and deleted in batches, one transaction per batch, so the
+    hot table is never locked for long. The sweep uses its own session, so it
+    never commits or detaches objects of the caller's db.session.
+    Returns the number of rows archived.
+    """
+    if older_than is None:
+        older_than = timedelta(days=app.config['CONNECTION_ARCHIVE_AFTER_DAYS'])
+    if batch_size is None:
+        batch_size = app.config['CONNECTION_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - older_than
+    
+    archived = 0
+    with db.session.session_factory() as sweep_session:
+        while True:
+            batch = sweep_session.scalars(
+                select(Connection)
+                .filter(
+                    Connection.status.in_(CLOSED_CONNECTION_STATUSES),
+                    Connection.closed_at <= cutoff
+                )
+                .order_by(Connection.closed_at)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            
+            now = datetime.utcnow()
+            rows = [
+                {
+                    'connection_id': c.id,
+                    'teacher_id': c.teacher_id,
+                    'learner_id': c.learner_id,
+                    'skill_id': c.skill_id,
+                    'status': c.status,
+                    'created_at': c.created_at,
+                    'closed_at': c.closed_at,
+                    'archived_at': now,
+                }
+                for c in batch
+            ]
+            ids = [row['connection_id'] for row in rows]
+            sweep_session.execute(insert(ConnectionArchive), rows)
+            sweep_session.execute(delete(Connection).where(Connection.id.in_(ids)))
+            sweep_session.commit()
+            sweep_session.expunge_all()
+            
+            archived += len(rows)
+            if len(rows) < batch_size:
+                break
+    
+    return archived
+
+def start_archive_sweeper(interval=None):
+    """Run archive_closed_connections periodically in a daemon thread."""
+    if interval is None:
+        interval = app.config['CONNECTION_ARCHIVE_INTERVAL']
+    
+    def sweep():
+        while True:
+            with app.app_context():
+                try:
+                    archived = archive_closed_connections()
+                    if archived:
+                        app.logger.info('Archived %d closed connections', archived)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Connection archive sweep failed')
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=sweep, name='connection-archiver', daemon=True)
+    thread.start()
+    return thread
+
+@app.cli.command('archive-connections')
+def archive_connections_command():
+    """Archive old rejected/completed connections."""
+    archived = archive_closed_connections()
+    print(f'Archived {archived} closed connections.')
+
 @app.route('/')
+@etag_cached(static=True)
 def index():
     return render_template("Index.html")
 
 @app.route('/services')
+@etag_cached(static=True)
 def services():
     return render_template("services.html")
 
@@ -201,11 +346,19 @@ def dashboard():
     # Get user's learning skills
     learning_skills = UserSkill.query.filter_by(user_id=current_user.id, is_teacher=False).all()
     
-    # Get user's teaching connections (as teacher)
-    teaching_connections = Connection.query.filter_by(teacher_id=current_user.id).all()
+    # Get user's live teaching connections (as teacher)
+    teaching_connections = (
+        Connection.query
+        .filter(Connection.teacher_id == current_user.id, Connection.status.in_(LIVE_CONNECTION_STATUSES))
+        .all()
+    )
     
-    # Get user's learning connections (as learner)
-    learning_connections = Connection.query.filter_by(learner_id=current_user.id).all()
+    # Get user's live learning connections (as learner)
+    learning_connections = (
+        Connection.query
+        .filter(Connection.learner_id == current_user.id, Connection.status.in_(LIVE_CONNECTION_STATUSES))
+        .all()
+    )
     
     # Get active connections (both teaching and learning, where status is 'accepted')
     active_connections = (
@@ -289,6 +442,7 @@ def add_user_skill():
 
 @app.route('/find-connections')
 @login_required
+@etag_cached('skill', 'user_skill', 'user')
 def find_connections():
     mode = request.args.get('mode', 'teachers')
     skill_id = request.args.get('skill_id', type=int)
@@ -327,21 +481,23 @@ def request_connection(user_id, skill_id, mode):
     target_user = User.query.get_or_404(user_id)
     skill = Skill.query.get_or_404(skill_id)
     
-    # Check if a connection already exists
+    # Check if a live connection already exists (closed ones don't block a new request)
     existing_connection = None
     if mode == 'teachers':
         # Current user wants to learn from target user
-        existing_connection = Connection.query.filter_by(
-            teacher_id=user_id,
-            learner_id=current_user.id,
-            skill_id=skill_id
+        existing_connection = Connection.query.filter(
+            Connection.teacher_id == user_id,
+            Connection.learner_id == current_user.id,
+            Connection.skill_id == skill_id,
+            Connection.status.in_(LIVE_CONNECTION_STATUSES)
         ).first()
     else:
         # Current user wants to teach target user
-        existing_connection = Connection.query.filter_by(
-            teacher_id=current_user.id,
-            learner_id=user_id,
-            skill_id=skill_id
+        existing_connection = Connection.query.filter(
+            Connection.teacher_id == current_user.id,
+            Connection.learner_id == user_id,
+            Connection.skill_id == skill_id,
+            Connection.status.in_(LIVE_CONNECTION_STATUSES)
         ).first()
     
     if existing_connection:
@@ -385,6 +541,11 @@ def handle_connection(connection_id, action):
         flash('You are not authorized to handle this connection request.', 'danger')
         return redirect(url_for('dashboard'))
     
+    # Closed connections can't be acted on any more
+    if connection.status in CLOSED_CONNECTION_STATUSES:
+        flash('This connection has already been closed.', 'info')
+        return redirect(url_for('dashboard'))
+    
     # For accepting connections, check who can accept based on the status
     if action == 'accept':
         if (connection.status == 'pending_learner' or connection.status == 'pending') and current_user.id != connection.teacher_id:
@@ -416,9 +577,22 @@ def handle_connection(connection_id, action):
             teacher = User.query.get(connection.teacher_id)
             flash(f'Teaching offer from {teacher.username} for {skill.name} has been accepted!', 'success')
     
+    elif action == 'complete':
+        # Either side can mark an accepted connection as completed
+        if connection.status != 'accepted':
+            flash('Only accepted connections can be marked as completed.', 'warning')
+            return redirect(url_for('dashboard'))
+        
+        connection.status = 'completed'
+        connection.closed_at = datetime.utcnow()
+        db.session.commit()
+        
+        skill = Skill.query.get(connection.skill_id)
+        other = connection.learner if current_user.id == connection.teacher_id else connection.teacher
+        flash(f'Your {skill.name} connection with {other.username} has been marked as completed.', 'success')
+    
     elif action == 'reject':
         # Both teachers and learners can reject/remove requests
-        # Store the information before deleting the connection
         skill = Skill.query.get(connection.skill_id)
         teacher = User.query.get(connection.teacher_id)
         learner = User.query.get(connection.learner_id)
@@ -439,14 +613,46 @@ def handle_connection(connection_id, action):
                 # Learner is rejecting a teaching offer
                 flash(f'Teaching offer from {teacher.username} for {skill.name} has been declined.', 'info')
         
-        # Delete the connection from the database
-        db.session.delete(connection)
+        # Keep the row for history; the archival sweep moves it out of the hot table later
+        connection.status = 'rejected'
+        connection.closed_at = datetime.utcnow()
         db.session.commit()
     
     return redirect(url_for('dashboard'))
 
+@app.route('/connections/history')
+@login_required
+def connection_history():
+    page = request.args.get('page', 1, type=int)
+    
+    # Closed connections the sweep hasn't archived yet (only on the first page)
+    recent_connections = []
+    if page == 1:
+        recent_connections = (
+            Connection.query
+            .filter(
+                ((Connection.teacher_id == current_user.id) | (Connection.learner_id == current_user.id)),
+                Connection.status.in_(CLOSED_CONNECTION_STATUSES)
+            )
+            .order_by(Connection.closed_at.desc())
+            .all()
+        )
+    
+    # Archived connections, read from cold storage one page at a time
+    archived_connections = (
+        ConnectionArchive.query
+        .filter((ConnectionArchive.teacher_id == current_user.id) | (ConnectionArchive.learner_id == current_user.id))
+        .order_by(ConnectionArchive.closed_at.desc())
+        .paginate(page=page, per_page=20, error_out=False)
+    )
+    
+    return render_template('connection_history.html',
+                          recent_connections=recent_connections,
+                          archived_connections=archived_connections)
+
 @app.route('/resources')
 @login_required
+@etag_cached('resource', 'skill', 'user_skill', 'user')
 def view_resources():
     # Get filter parameters
     skill_id = request.args.get('skill_id', type=int)
@@ -503,6 +709,7 @@ def share_resource():
 
 
 @app.route('/community')
+@etag_cached('post', 'user')
 def community():
     posts = Post.query.order_by(Post.created_at.desc()).all()
     delete_form = DeletePostForm()
@@ -526,6 +733,7 @@ def new_post():
 
 
 @app.route('/community/<int:post_id>', methods=['GET', 'POST'])
+@etag_cached('post', 'comment', 'user')
 def post_detail(post_id):
     post = Post.query.get_or_404(post_id)
     if request.method == 'POST':
@@ -555,4 +763,7 @@ def delete_post(post_id):
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()  # Create database tables if they don't exist
+    # The debug reloader runs this block twice; only sweep from the serving process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_archive_sweeper()
     app.run(debug=True)
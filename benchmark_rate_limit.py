@@ -0,0 +1,78 @@
+"""Measure the per-request cost of the rate limiter in microseconds.
+
+Times a bucket hit on each storage backend (including from a new thread per
+hit, as the dev server serves requests, minus the cost of starting the
+thread) and the full before-request check, next to the password hash check
+it protects login from:
+
+    python benchmark_rate_limit.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app import app
+from rate_limit import MemoryBuckets, SQLiteBuckets, check_rate_limit
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+CLIENTS = 1000  # Distinct IPs the hits are spread over
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_storage(storage, iterations):
+    return per_call_us(lambda i: storage.hit(f'login:ip:10.0.{i % CLIENTS // 256}.{i % 256}', 10, 60), iterations)
+
+
+def bench_fresh_threads(storage, iterations):
+    """Hit a bucket from a new thread each time, like the dev server's requests."""
+    def run(i):
+        thread = threading.Thread(target=storage.hit, args=(f'login:ip:10.0.0.{i % 256}', 10, 60))
+        thread.start()
+        thread.join()
+    def idle(i):
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+    return per_call_us(run, iterations) - per_call_us(idle, iterations)
+
+
+def bench_check(storage, iterations):
+    """Run the before-request hook in a login POST context, like a real request."""
+    app.extensions['rate_limiter'] = storage
+    with app.test_request_context('/login', method='POST', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        # Generous limit so every call takes the allowed path
+        app.config['RATELIMITS'] = {'login': {'methods': ('POST',), 'ip': (10 ** 9, 1)}}
+        return per_call_us(lambda i: check_rate_limit(), iterations)
+
+
+if __name__ == '__main__':
+    sqlite_path = os.path.join(tempfile.mkdtemp(), 'ratelimit.db')
+    password_hash = generate_password_hash('benchmark')
+    hash_us = per_call_us(lambda i: check_password_hash(password_hash, 'benchmark'), 20)
+
+    rows = [
+        ('memory bucket hit', bench_storage(MemoryBuckets(), ITERATIONS)),
+        ('sqlite bucket hit', bench_storage(SQLiteBuckets(sqlite_path), ITERATIONS // 10)),
+        ('sqlite hit, fresh thread', bench_fresh_threads(SQLiteBuckets(sqlite_path), ITERATIONS // 10)),
+        ('memory request check', bench_check(MemoryBuckets(), ITERATIONS)),
+        ('sqlite request check', bench_check(SQLiteBuckets(sqlite_path), ITERATIONS // 10)),
+        ('password hash check', hash_us),
+    ]
+
+    print(f"\n=== RATE LIMITER BENCHMARK ({ITERATIONS} iterations, {CLIENTS} clients) ===")
+    print("-" * 50)
+    print(f"{'OPERATION':<28} {'COST (us)':>20}")
+    print("-" * 50)
+    for name, cost in rows:
+        print(f"{name:<28} {cost:>20.2f}")
+    print("-" * 50)
@@ -0,0 +1,83 @@
+"""Replay repeat visits to the read-only pages and report what the response cache saves.
+
+Runs against a throwaway SQLite database, so it never touches peer_to_peer.db:
+
+    python benchmark_response_cache.py [visits]
+"""
+import os
+import sys
+import tempfile
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_file
+
+from app import app, db, User, Skill, UserSkill, Resource, Post, Comment
+
+VISITS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+PAGES = ['/', '/services', '/community', '/community/1', '/resources', '/find-connections?mode=teachers&skill_id=1']
+
+
+def seed():
+    db.create_all()
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('benchmark')
+    db.session.add(user)
+    skills = [Skill(name=f'Skill {i}', description='Benchmark skill') for i in range(10)]
+    db.session.add_all(skills)
+    db.session.commit()
+    for skill in skills:
+        db.session.add(UserSkill(user_id=user.id, skill_id=skill.id, skill_level=3, is_teacher=True))
+        for i in range(5):
+            db.session.add(Resource(title=f'{skill.name} resource {i}', description='x' * 200,
+                                    url='https://example.com', skill_id=skill.id, user_id=user.id))
+    for i in range(30):
+        post = Post(title=f'Post {i}', content='Lorem ipsum dolor sit amet. ' * 20, user_id=user.id)
+        db.session.add(post)
+        db.session.flush()
+        db.session.add(Comment(content='Nice post!', post_id=post.id, user_id=user.id))
+    db.session.commit()
+
+
+def replay(enabled):
+    """Visit every page once, then revisit it VISITS times like a browser would."""
+    app.config['RESPONSE_CACHE_ENABLED'] = enabled
+    client = app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'benchmark'})
+    client.get('/dashboard')  # Consume the login flash message
+
+    headers = {'Accept-Encoding': 'br, gzip'}
+    sent = 0
+    etags = {}
+    start = time.perf_counter()
+    for _ in range(VISITS):
+        for page in PAGES:
+            request_headers = dict(headers)
+            if page in etags:
+                request_headers['If-None-Match'] = etags[page]
+            response = client.get(page, headers=request_headers)
+            sent += len(response.get_data())
+            if response.headers.get('ETag'):
+                etags[page] = response.headers['ETag']
+    elapsed = time.perf_counter() - start
+    return sent, elapsed
+
+
+if __name__ == '__main__':
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        seed()
+
+    requests = VISITS * len(PAGES)
+    baseline_bytes, baseline_time = replay(enabled=False)
+    cached_bytes, cached_time = replay(enabled=True)
+
+    print(f"\n=== RESPONSE CACHE BENCHMARK ({requests} requests over {len(PAGES)} pages) ===")
+    print("-" * 70)
+    print(f"{'MODE':<12} {'BYTES SENT':>15} {'TOTAL TIME (s)':>16} {'PER REQUEST (ms)':>20}")
+    print("-" * 70)
+    print(f"{'uncached':<12} {baseline_bytes:>15,} {baseline_time:>16.3f} {baseline_time / requests * 1000:>20.3f}")
+    print(f"{'cached':<12} {cached_bytes:>15,} {cached_time:>16.3f} {cached_time / requests * 1000:>20.3f}")
+    print("-" * 70)
+    print(f"Bandwidth saved: {100 * (1 - cached_bytes / baseline_bytes):.1f}%")
+    print(f"CPU time saved:  {100 * (1 - cached_time / baseline_time):.1f}%")
@@ -0,0 +1,172 @@
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+
+from flask import current_app, request, session, make_response
+
+
+def refill(tokens, updated, capacity, period, now):
+    """Top a token bucket back up for the time elapsed since it was last used."""
+    return min(capacity, tokens + (now - updated) * capacity / period)
+
+
+def take_token(tokens, capacity, period):
+    """Spend one token if there is one.
+
+    Returns the remaining tokens and how many seconds the caller has to wait
+    (0 if the request is allowed).
+    """
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) * period / capacity
+
+
+class MemoryBuckets:
+    """Token buckets kept in this process, bounded to `max_keys` entries.
+
+    When full, the least recently used bucket is dropped; a dropped bucket
+    simply starts again full, so eviction can only ever be lenient.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def hit(self, key, capacity, period, now=None):
+        now = time() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens, wait = take_token(refill(tokens, updated, capacity, period, now), capacity, period)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBuckets:
+    """Token buckets in a local SQLite file, shared by every worker on the host.
+
+    Connections are opened lazily and kept in a small pool shared by all
+    threads, since the dev server starts a new thread for every request. The
+    pool is dropped when the process id changes, so workers forked from a
+    preloaded app never reuse the parent's connections.
+
+    Buckets that have refilled completely carry no information, so they are
+    purged every `purge_every` hits to keep the table small.
+    """
+
+    def __init__(self, path, purge_every=1000):
+        self.path = path
+        self.purge_every = purge_every
+        self.hits = 0
+        self.pool = []
+        self.pool_lock = threading.Lock()
+        self.pid = os.getpid()
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)'
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def acquire(self):
+        with self.pool_lock:
+            if self.pid != os.getpid():
+                # Forked: the inherited connections belong to the parent
+                self.pid = os.getpid()
+                self.pool = []
+            if self.pool:
+                return self.pool.pop()
+        # Autocommit mode, transactions are opened explicitly in hit()
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def release(self, conn):
+        with self.pool_lock:
+            if self.pid == os.getpid():
+                self.pool.append(conn)
+                return
+        conn.close()
+
+    def hit(self, key, capacity, period, now=None):
+        now = time() if now is None else now
+        conn = self.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT tokens, updated FROM rate_limit_bucket WHERE key = ?', (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens, wait = take_token(refill(tokens, updated, capacity, period, now), capacity, period)
+                full_at = now + (capacity - tokens) * period / capacity
+                conn.execute(
+                    'INSERT OR REPLACE INTO rate_limit_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                    (key, tokens, now, full_at)
+                )
+                self.hits += 1
+                if self.hits % self.purge_every == 0:
+                    conn.execute('DELETE FROM rate_limit_bucket WHERE full_at <= ?', (now,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            self.release(conn)
+        return wait
+
+
+def init_rate_limiter(app):
+    """Check the per-endpoint limits in RATELIMITS before each request."""
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMITS', {})
+    app.config.setdefault('RATELIMIT_MAX_KEYS', 10000)
+    app.config.setdefault('RATELIMIT_STORAGE_PATH', None)
+
+    if app.config['RATELIMIT_STORAGE_PATH']:
+        storage = SQLiteBuckets(app.config['RATELIMIT_STORAGE_PATH'])
+    else:
+        storage = MemoryBuckets(app.config['RATELIMIT_MAX_KEYS'])
+    app.extensions['rate_limiter'] = storage
+
+    app.before_request(check_rate_limit)
+
+
+def check_rate_limit():
+    """Reject over-limit requests with 429 before the view does any work.
+
+    Limits are looked up by endpoint. The client is identified by its IP
+    address and, for the 'user' limit, by the user id stored in the session
+    cookie, so no database query is needed to tell users apart.
+    """
+    if not current_app.config['RATELIMIT_ENABLED']:
+        return None
+    limits = current_app.config['RATELIMITS'].get(request.endpoint)
+    if not limits:
+        return None
+    methods = limits.get('methods')
+    if methods and request.method not in methods:
+        return None
+
+    storage = current_app.extensions['rate_limiter']
+    now = time()
+    wait = 0
+    for scope, client in (('ip', request.remote_addr), ('user', session.get('_user_id'))):
+        if scope in limits and client:
+            capacity, period = limits[scope]
+            key = f'{request.endpoint}:{scope}:{client}'
+            wait = max(wait, storage.hit(key, capacity, period, now))
+
+    if wait:
+        response = make_response('Too many requests. Please try again later.\n', 429)
+        response.mimetype = 'text/plain'
+        response.headers['Retry-After'] = str(math.ceil(wait))
+        return response
+    return None
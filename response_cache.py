@@ -0,0 +1,242 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import time
+
+from flask import current_app, request, session, make_response
+from sqlalchemy import event, select, update, insert
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+# Pre-rendered and pre-compressed bodies of static pages, keyed by ETag.
+# Shared by all request threads, so only touch it while holding the lock.
+static_pages = OrderedDict()
+static_pages_lock = threading.Lock()
+STATIC_PAGES_MAX = 64
+
+
+def code_version(root):
+    """Fingerprint the app's code and templates, so a deploy changes every ETag.
+
+    Built from file modification times, so every worker on a host agrees on it.
+    """
+    stamps = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+        for filename in sorted(filenames):
+            if filename.endswith(('.py', '.html')):
+                path = os.path.join(dirpath, filename)
+                stamps.append(f'{path}:{os.stat(path).st_mtime_ns}')
+    return hashlib.blake2b('|'.join(sorted(stamps)).encode(), digest_size=4).hexdigest()
+
+
+def init_response_cache(app, db):
+    """Track table writes on the app's session and compress HTML responses."""
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+
+    # Per-table version counters, bumped in the same transaction as the write,
+    # so every worker process sees them
+    version_table = db.Table(
+        'table_version',
+        db.Column('name', db.String(50), primary_key=True),
+        db.Column('version', db.Integer, nullable=False, default=0),
+    )
+    app.extensions['response_cache'] = {
+        'db': db,
+        'version_table': version_table,
+        'code_version': code_version(app.root_path),
+    }
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_flushed_tables(db_session, flush_context):
+        touched = db_session.info.setdefault('touched_tables', set())
+        for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+            table = getattr(obj, '__table__', None)
+            if table is not None:
+                touched.add(table.name)
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def collect_bulk_tables(orm_execute_state):
+        # Bulk insert()/update()/delete() statements skip the flush
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None:
+                orm_execute_state.session.info.setdefault('touched_tables', set()).add(table.name)
+
+    @event.listens_for(db.session, 'before_commit')
+    def bump_table_versions(db_session):
+        # Flush now so the final flush's tables are collected too
+        db_session.flush()
+        touched = db_session.info.pop('touched_tables', set())
+        touched.discard(version_table.name)
+        if not touched:
+            return
+        # Goes through the connection, not the session, to skip the listeners above
+        conn = db_session.connection()
+        for name in sorted(touched):
+            bumped = conn.execute(
+                update(version_table)
+                .where(version_table.c.name == name)
+                .values(version=version_table.c.version + 1)
+            )
+            if bumped.rowcount == 0:
+                conn.execute(insert(version_table).values(name=name, version=1))
+
+    @event.listens_for(db.session, 'after_rollback')
+    def forget_touched_tables(db_session):
+        db_session.info.pop('touched_tables', None)
+
+    app.after_request(compress_response)
+
+
+def table_versions(tables):
+    """Read the version counters of `tables` in one small query."""
+    if not tables:
+        return {}
+    cache = current_app.extensions['response_cache']
+    version_table = cache['version_table']
+    rows = cache['db'].session.execute(
+        select(version_table.c.name, version_table.c.version)
+        .where(version_table.c.name.in_(tables))
+    )
+    return dict(rows.all())
+
+
+def compute_etag(tables, page, identity):
+    """Build a cheap ETag from table versions, the page URL and who is asking."""
+    # Pages embedding CSRF tokens must be re-rendered before the tokens expire
+    csrf_window = current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600
+    parts = [
+        current_app.extensions['response_cache']['code_version'],
+        page,
+        identity,
+        str(int(time() // (csrf_window / 2))),
+    ]
+    versions = table_versions(tables)
+    parts.extend(f'{name}:{versions.get(name, 0)}' for name in sorted(tables))
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=12).hexdigest()
+
+
+def choose_encoding():
+    """Pick the best content encoding the client accepts, or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    level = current_app.config['COMPRESS_LEVEL']
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level)
+
+
+def etag_cached(*tables, static=False):
+    """Answer conditional GETs with 304 before the view runs any query or template.
+
+    `tables` are the table names the page is built from; the only query run
+    for a 304 is the read of their version counters. Static pages only vary
+    by whether the visitor is logged in, so their rendered and compressed
+    bodies are also kept in memory and reused across visitors.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = session.get('_user_id')
+            remember_cookie = current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')
+            if (not current_app.config['RESPONSE_CACHE_ENABLED']
+                    or request.method not in ('GET', 'HEAD')
+                    or session.get('_flashes')
+                    or (user_id is None and remember_cookie in request.cookies)):
+                # Pending flash messages make the page one-off, and a visitor only
+                # known by their remember cookie can't be identified without a query
+                return view(*args, **kwargs)
+
+            # Read the user id from the session cookie, like rate_limit.py, so
+            # no user query runs before deciding on a 304
+            if static:
+                identity = 'auth' if user_id else 'anon'
+                page = request.path
+            else:
+                identity = user_id or 'anon'
+                page = request.full_path
+            etag = compute_etag(tables, page, identity)
+
+            bodies = None
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                if static:
+                    with static_pages_lock:
+                        bodies = static_pages.get(etag)
+                        if bodies is not None:
+                            static_pages.move_to_end(etag)
+                if bodies is not None:
+                    response = static_page_response(bodies)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if static and response.status_code == 200:
+                        bodies = {None: response.get_data()}
+                        with static_pages_lock:
+                            static_pages[etag] = bodies
+                            while len(static_pages) > STATIC_PAGES_MAX:
+                                static_pages.popitem(last=False)
+                        response = static_page_response(bodies)
+
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def static_page_response(bodies):
+    """Serve a cached static page, compressing it once per encoding.
+
+    `bodies` maps an encoding (None for identity) to the page body.
+    """
+    encoding = choose_encoding()
+    if encoding is not None and len(bodies[None]) < current_app.config['COMPRESS_MIN_SIZE']:
+        encoding = None
+    if encoding is not None and encoding not in bodies:
+        bodies[encoding] = compress(bodies[None], encoding)
+
+    response = make_response(bodies[encoding])
+    response.content_type = 'text/html; charset=utf-8'
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compress_response(response):
+    """Compress large text responses that weren't compressed already."""
+    if (not current_app.config['RESPONSE_CACHE_ENABLED']
+            or response.status_code != 200
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith('text/')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
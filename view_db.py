@@ -1,4 +1,4 @@
-from app import app, User, Skill, UserSkill, Connection, Resource, db
+from app import app, User, Skill, UserSkill, Connection, ConnectionArchive, Resource, db
 
 # Use app context to query the database
 with app.app_context():
@@ -70,6 +70,9 @@ with app.app_context():
     else:
         print("No connections found in the database.")
     
+    # Display archived connection count
+    print(f"\nArchived connections: {ConnectionArchive.query.count()}")
+    
     # Display resources
     resources = Resource.query.all()
     print("\n=== RESOURCES ===")